@@ -0,0 +1,40 @@
+"""
+JSON 檔讀寫（台股抓取與報告生成共用）
+
+有 orjson 時使用 orjson，未安裝時退回標準庫 json
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:  # 未安裝 orjson 時退回標準庫 json
+    orjson = None
+
+
+def load_json(path: str):
+    """讀取 JSON 檔（有 orjson 時使用 orjson）"""
+    if orjson is not None:
+        with open(path, 'rb') as f:
+            raw = f.read()
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            # 標準庫 json 寫出的 NaN/Infinity 不是合法 JSON，orjson 會拒絕，改用 json 解析
+            return json.loads(raw)
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def dump_json(obj, path: str, pretty: bool = False):
+    """寫出保留中文的 JSON 檔，預設為緊湊格式，pretty 時縮排 2 格（有 orjson 時使用 orjson）"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if pretty else 0)
+        with open(path, 'wb') as f:
+            f.write(orjson.dumps(obj, option=option))
+        return
+    with open(path, 'w', encoding='utf-8') as f:
+        if pretty:
+            json.dump(obj, f, ensure_ascii=False, indent=2)
+        else:
+            json.dump(obj, f, ensure_ascii=False, separators=(',', ':'))
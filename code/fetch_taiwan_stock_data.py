@@ -4,22 +4,209 @@
 使用台灣證交所公開資訊觀測站 API
 """
 
+import argparse
+import asyncio
+import base64
+import os
+import random
 import requests
 import json
 import time
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+import zlib
+from datetime import date, datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from _json_io import dump_json, load_json
+
+try:
+    import httpx
+except ImportError:  # 未安裝 httpx 時退回同步抓取
+    httpx = None
+
+# httpx 需搭配 h2 套件才能以 HTTP/2 多工傳輸；未安裝時使用 HTTP/1.1
+try:
+    import h2  # noqa: F401
+    HTTP2_ENABLED = httpx is not None
+except ImportError:
+    HTTP2_ENABLED = False
+
+# 季報一年只更新四次，快取 90 天即可
+STATEMENT_TTL_DAYS = 90
+
+# 請求間隔（秒）的上下限：被限流時加倍、正常時逐步縮短
+MIN_DELAY = 0.25
+MAX_DELAY = 8.0
+
+# 被限流或伺服器錯誤時的重試策略（同步與非同步抓取共用）
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+MAX_RETRIES = 3
+RETRY_BACKOFF = 1.0
+# Retry-After 過長時的等待上限（秒）
+MAX_RETRY_WAIT = 60.0
+
+
+class FileCache:
+    """以 JSON 檔為單位的簡易 TTL 快取"""
+    
+    def __init__(self, cache_dir: str = '.cache/tw'):
+        self.cache_dir = cache_dir
+    
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+    
+    def get(self, key: str, ttl_days: float) -> Optional[Dict]:
+        """讀取快取，不存在、無法讀取、損毀或過期時回傳 None"""
+        try:
+            entry = load_json(self._path(key))
+        except (OSError, json.JSONDecodeError):
+            return None
+        
+        if time.time() - entry['ts'] < ttl_days * 86400:
+            return entry['value']
+        return None
+    
+    def set(self, key: str, value: Dict):
+        """寫入快取並記錄寫入時間"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        dump_json({'ts': time.time(), 'value': value}, self._path(key))
+
 
 class TWStockDataFetcher:
     """台股數據抓取器"""
     
-    def __init__(self):
+    def __init__(self, force_refresh: bool = False, cache_dir: str = '.cache/tw', debug: bool = False):
         self.base_url = "https://mops.twse.com.tw/mops/web/ajax_t163sb04"
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         }
+        
+        # 共用連線池，避免每檔股票都重新做 TCP/TLS 握手
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=4,
+            max_retries=Retry(
+                total=MAX_RETRIES,
+                backoff_factor=RETRY_BACKOFF,
+                status_forcelist=list(RETRY_STATUSES),
+                allowed_methods=['POST']
+            )
+        )
+        self.session.mount('https://', adapter)
+        
+        # 財報快取；force_refresh 時略過讀取，但仍會寫入新資料
+        self.cache = FileCache(cache_dir)
+        self.force_refresh = force_refresh
+        
+        # 除錯模式才保留原始回應
+        self.debug = debug
+        
+        # 兩次實際請求之間的間隔（秒），依伺服器回應動態調整，避免被封IP
+        self._delay = 0.5
+        self._last_request_at = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def close(self):
+        """關閉連線池"""
+        self.session.close()
+    
+    def _build_params(self, stock_code: str, year: int, season: int) -> Dict:
+        """組出公開資訊觀測站的查詢參數"""
+        return {
+            'encodeURIComponent': 1,
+            'step': 1,
+            'firstin': 1,
+            'off': 1,
+            'co_id': stock_code,
+            'year': year,
+            'season': season
+        }
+    
+    def _cache_key(self, stock_code: str, year: int, season: int) -> str:
+        return f"{stock_code}_{year}Q{season}"
+    
+    def _get_cached(self, stock_code: str, year: int, season: int) -> Optional[Dict]:
+        """查詢快取，force_refresh 時一律視為未命中"""
+        if self.force_refresh:
+            return None
+        cached = self.cache.get(self._cache_key(stock_code, year, season), ttl_days=STATEMENT_TTL_DAYS)
+        if cached:
+            # 舊版曾把除錯用的原始回應一併寫入快取，讀出時去掉
+            cached.pop('raw_html_zlib', None)
+        return cached
+    
+    def _throttle(self):
+        """確保兩次實際打到伺服器的請求至少間隔目前的延遲加上隨機抖動"""
+        if self._last_request_at is not None:
+            wait = self._jittered_delay() - (time.monotonic() - self._last_request_at)
+            if wait > 0:
+                time.sleep(wait)
+        self._last_request_at = time.monotonic()
+    
+    def _jittered_delay(self) -> float:
+        return self._delay + random.uniform(0, 0.25)
+    
+    def _adjust_delay(self, throttled: bool):
+        """被限流時延遲加倍，正常回應時逐步縮短"""
+        if throttled:
+            self._delay = min(self._delay * 2, MAX_DELAY)
+        else:
+            self._delay = max(self._delay * 0.9, MIN_DELAY)
     
-    def fetch_financial_statement(self, stock_code: str, year: int, season: int) -> Optional[Dict]:
+    @staticmethod
+    def _retry_wait(response, attempt: int) -> float:
+        """第 attempt 次失敗後的等待秒數：有 Retry-After 時依伺服器指示，否則指數退避"""
+        wait = RETRY_BACKOFF * (2 ** attempt)
+        value = response.headers.get('Retry-After') if response is not None else None
+        if value:
+            try:
+                wait = float(value)
+            except ValueError:
+                # Retry-After 也可能是 HTTP 日期
+                try:
+                    wait = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+                except (TypeError, ValueError):
+                    pass
+        return min(max(wait, 0.0), MAX_RETRY_WAIT)
+    
+    def _build_record(self, stock_code: str, year: int, season: int, response,
+                      timestamp: Optional[str] = None) -> Dict:
+        """將回應整理成財報數據字典（requests 與 httpx 的回應皆適用）"""
+        return {
+            'stock_code': stock_code,
+            'year': year,
+            'season': season,
+            'timestamp': timestamp or datetime.now().isoformat(timespec='seconds')
+        }
+    
+    def _save_record(self, stock_code: str, year: int, season: int, response,
+                     timestamp: Optional[str] = None) -> Dict:
+        """整理回應並寫入快取，回傳財報數據字典（快取寫入失敗不影響本次抓取結果）"""
+        record = self._build_record(stock_code, year, season, response, timestamp)
+        try:
+            self.cache.set(self._cache_key(stock_code, year, season), record)
+        except OSError as e:
+            print(f"⚠️  快取寫入失敗 {stock_code} ({year}Q{season}): {e}")
+        
+        # 原始 HTML 下游未使用，僅在除錯時以 zlib 壓縮後的 base64 保存完整回應；
+        # 只加在本次回傳的副本上，不寫入快取，之後的一般執行才不會讀到
+        if self.debug:
+            record = dict(record, raw_html_zlib=base64.b64encode(zlib.compress(response.content)).decode('ascii'))
+        
+        return record
+    
+    def fetch_financial_statement(self, stock_code: str, year: int, season: int,
+                                  timestamp: Optional[str] = None) -> Optional[Dict]:
         """
         抓取單一股票的季度財報
         
@@ -27,97 +214,186 @@ class TWStockDataFetcher:
             stock_code: 股票代碼 (e.g., "2330")
             year: 民國年 (e.g., 113 for 2024)
             season: 季度 (1-4)
+            timestamp: 批次共用的抓取時間，未提供時取當下時間
         
         Returns:
-            財報數據字典，失敗回傳 None
+            財報數據字典，失敗回傳 None；其中 timestamp 為實際向證交所抓取的時間，
+            命中快取時保留當初抓取的時間，而非本批次時間
         """
-        params = {
-            'encodeURIComponent': 1,
-            'step': 1,
-            'firstin': 1,
-            'off': 1,
-            'co_id': stock_code,
-            'year': year,
-            'season': season
-        }
+        cached = self._get_cached(stock_code, year, season)
+        if cached:
+            return cached
+        
+        params = self._build_params(stock_code, year, season)
         
         try:
-            response = requests.post(self.base_url, data=params, headers=self.headers, timeout=30)
+            self._throttle()
+            response = self.session.post(self.base_url, data=params, timeout=30)
+            self._adjust_delay(response.status_code == 429)
             response.raise_for_status()
-            
-            # 簡化：返回原始 HTML，後續需解析
-            return {
-                'stock_code': stock_code,
-                'year': year,
-                'season': season,
-                'timestamp': datetime.now().isoformat(),
-                'raw_html': response.text[:500]  # 只存前500字符示範
-            }
+            return self._save_record(stock_code, year, season, response, timestamp)
+        
+        except requests.exceptions.RetryError as e:
+            # 重試用盡仍被限流或伺服器錯誤，拉長之後的請求間隔
+            self._adjust_delay(True)
+            print(f"❌ 抓取失敗 {stock_code} ({year}Q{season}): {e}")
+            return None
         
         except Exception as e:
             print(f"❌ 抓取失敗 {stock_code} ({year}Q{season}): {e}")
             return None
     
-    def fetch_portfolio_data(self, portfolio_path: str = 'data/config/portfolio_holdings.json') -> Dict:
-        """
-        批次抓取持倉所有台股的最新財報
+    @staticmethod
+    @lru_cache(maxsize=4)
+    def _tw_quarter(today: date) -> Tuple[int, int]:
+        """依日期計算目標財報的 (民國年, 季度)"""
+        tw_year = today.year - 1911
+        season = (today.month - 1) // 3 + 1
         
-        Args:
-            portfolio_path: 持倉數據檔案路徑
+        # 如果是季初，使用上一季
+        if today.month % 3 == 1 and today.day < 15:
+            season -= 1
+            if season == 0:
+                season = 4
+                tw_year -= 1
         
-        Returns:
-            所有股票的財報數據
-        """
+        return tw_year, season
+    
+    def _prepare_batch(self, portfolio_path: str):
+        """讀取持倉並決定目標季度，回傳 (台股持倉, 民國年, 季度, 批次時間戳)"""
         # 讀取持倉
-        with open(portfolio_path, 'r', encoding='utf-8') as f:
-            portfolio = json.load(f)
+        portfolio = load_json(portfolio_path)
         
-        results = {}
         taiwan_stocks = portfolio.get('taiwan_stocks', {})
         
         # 計算當前民國年和季度
         now = datetime.now()
-        tw_year = now.year - 1911
-        current_season = (now.month - 1) // 3 + 1
-        
-        # 如果是季初，使用上一季
-        if now.month % 3 == 1 and now.day < 15:
-            current_season -= 1
-            if current_season == 0:
-                current_season = 4
-                tw_year -= 1
+        tw_year, current_season = self._tw_quarter(now.date())
         
         print(f"📅 抓取時間: {now.strftime('%Y-%m-%d %H:%M')}")
         print(f"📊 目標季度: {tw_year}年Q{current_season}")
         print("=" * 80)
         
+        # 整批實際抓取的股票共用同一個時間戳，不必每檔各取一次（命中快取者保留原抓取時間）
+        return taiwan_stocks, tw_year, current_season, now.isoformat(timespec='seconds')
+    
+    def fetch_portfolio_data(self, portfolio_path: str = 'data/config/portfolio_holdings.json') -> Dict:
+        """
+        批次抓取持倉所有台股的最新財報
+        
+        Args:
+            portfolio_path: 持倉數據檔案路徑
+        
+        Returns:
+            所有股票的財報數據
+        """
+        taiwan_stocks, tw_year, current_season, batch_ts = self._prepare_batch(portfolio_path)
+        results = {}
+        
         for stock_code, stock_info in taiwan_stocks.items():
             print(f"🔍 抓取 {stock_code} {stock_info['name']}...")
-            data = self.fetch_financial_statement(stock_code, tw_year, current_season)
+            data = self.fetch_financial_statement(stock_code, tw_year, current_season, timestamp=batch_ts)
             
             if data:
                 results[stock_code] = data
                 print(f"  ✅ 成功")
             else:
                 print(f"  ❌ 失敗")
-            
-            # 避免被封IP，延遲2秒
-            time.sleep(2)
         
         return results
+    
+    async def fetch_portfolio_data_async(self, portfolio_path: str = 'data/config/portfolio_holdings.json',
+                                         concurrency: int = 3) -> Dict:
+        """
+        非同步批次抓取持倉所有台股的最新財報
+        
+        以 semaphore 限制同時連線數，取代逐檔抓取加固定延遲的作法；
+        安裝 h2 時以 HTTP/2 在同一條連線上多工傳送各檔請求
+        
+        Args:
+            portfolio_path: 持倉數據檔案路徑
+            concurrency: 同時進行的請求數上限
+        
+        Returns:
+            所有股票的財報數據
+        """
+        if httpx is None:
+            raise ImportError("非同步抓取需要 httpx，請先執行 pip install httpx")
+        
+        taiwan_stocks, tw_year, current_season, batch_ts = self._prepare_batch(portfolio_path)
+        sem = asyncio.Semaphore(concurrency)
+        limits = httpx.Limits(max_connections=4, max_keepalive_connections=4)
+        
+        async with httpx.AsyncClient(http2=HTTP2_ENABLED, limits=limits, timeout=30.0,
+                                     headers=self.headers) as client:
+            tasks = [
+                self._fetch_one(client, sem, stock_code, stock_info, tw_year, current_season, batch_ts)
+                for stock_code, stock_info in taiwan_stocks.items()
+            ]
+            fetched = await asyncio.gather(*tasks)
+        
+        return {stock_code: data for stock_code, data in zip(taiwan_stocks, fetched) if data}
+    
+    async def _fetch_one(self, client, sem, stock_code: str, stock_info: Dict,
+                         year: int, season: int, timestamp: Optional[str] = None) -> Optional[Dict]:
+        """在 semaphore 保護下抓取單一股票，失敗回傳 None"""
+        cached = self._get_cached(stock_code, year, season)
+        if cached:
+            print(f"📦 {stock_code} {stock_info['name']} 使用快取")
+            return cached
+        
+        params = self._build_params(stock_code, year, season)
+        
+        async with sem:
+            print(f"🔍 抓取 {stock_code} {stock_info['name']}...")
+            # 429/5xx 與連線錯誤最多重試 MAX_RETRIES 次，重試期間持續佔用併發槽
+            for attempt in range(MAX_RETRIES + 1):
+                try:
+                    response = await client.post(self.base_url, data=params)
+                    self._adjust_delay(response.status_code == 429)
+                    if response.status_code in RETRY_STATUSES and attempt < MAX_RETRIES:
+                        wait = self._retry_wait(response, attempt)
+                        print(f"  ⏳ {stock_code} HTTP {response.status_code}，{wait:.1f} 秒後重試")
+                        await asyncio.sleep(wait)
+                        continue
+                    response.raise_for_status()
+                    data = self._save_record(stock_code, year, season, response, timestamp)
+                    print(f"  ✅ {stock_code} 成功")
+                except httpx.TransportError as e:
+                    if attempt < MAX_RETRIES:
+                        await asyncio.sleep(self._retry_wait(None, attempt))
+                        continue
+                    print(f"❌ 抓取失敗 {stock_code} ({year}Q{season}): {e}")
+                    data = None
+                except Exception as e:
+                    print(f"❌ 抓取失敗 {stock_code} ({year}Q{season}): {e}")
+                    data = None
+                break
+            
+            # 避免被封IP，每個併發槽打完伺服器後依目前延遲停頓
+            await asyncio.sleep(self._jittered_delay())
+        
+        return data
 
 
 def main():
     """主函數"""
-    fetcher = TWStockDataFetcher()
+    parser = argparse.ArgumentParser(description='抓取持倉台股的最新季度財報')
+    parser.add_argument('--force-refresh', action='store_true', help='忽略本地快取，重新向證交所抓取')
+    parser.add_argument('--debug', action='store_true', help='保留壓縮後的原始回應以便除錯')
+    parser.add_argument('--pretty', action='store_true', help='輸出縮排的 JSON，方便人工檢視')
+    args = parser.parse_args()
     
-    # 抓取持倉數據
-    results = fetcher.fetch_portfolio_data()
+    # 抓取持倉數據（有 httpx 時走非同步並行抓取）
+    with TWStockDataFetcher(force_refresh=args.force_refresh, debug=args.debug) as fetcher:
+        if httpx is not None:
+            results = asyncio.run(fetcher.fetch_portfolio_data_async())
+        else:
+            results = fetcher.fetch_portfolio_data()
     
     # 儲存結果
     output_path = 'data/raw/tw_stock_financials.json'
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(results, f, ensure_ascii=False, indent=2)
+    dump_json(results, output_path, pretty=args.pretty)
     
     print("\n" + "=" * 80)
     print(f"✅ 資料已儲存至 {output_path}")
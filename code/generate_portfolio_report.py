@@ -4,10 +4,59 @@
 整合三層分析結果並推送到 Google Sheets
 """
 
-import json
+import argparse
+import bisect
+import math
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from _json_io import dump_json, load_json
+
+MARKETS = ('taiwan_stocks', 'us_stocks')
+
+# 報告所需的輸入檔
+ANALYSIS_FILES = {
+    'portfolio': 'data/config/portfolio_holdings.json',
+    'tang_scores': 'data/analysis/tang_scores.json',
+    'moat_ratings': 'data/analysis/moat_ratings.json',
+    'risk_levels': 'data/analysis/risk_levels.json'
+}
+# 持倉表格的表頭與列格式（欄位順序與 Sheets 列相同）
+MARKDOWN_TABLE_HEADER = (
+    "| 股票代碼 | 名稱 | 成本價 | 持股數 | 唐石峻評分 | 護城河等級 | 風險等級 | 建議 |\n"
+    "|---------|------|--------|--------|-----------|----------|---------|------|\n"
+)
+_format_markdown_row = "| {} | {} | {} | {} | {} | {} | {} | {} |\n".format
+
+HIGH_RISK_LEVELS = ('高風險', 'High Risk')
+WIDE_MOAT_RATINGS = ('寬護城河', 'Wide Moat')
+
+# 唐石峻評分分界：<60 為區間 0、60-80 為區間 1、>=80 為區間 2
+SCORE_BREAKPOINTS = [60, 80]
+_BUCKET_RECOMMENDATIONS = {None: "⚪ 待評估", 0: "🟠 觀察", 1: "🟡 持有", 2: "🟡 持有"}
+
+# (評分區間, 是否高風險, 是否寬護城河) -> 建議；評分區間 None 代表尚無數值評分
+RECOMMENDATION_TABLE = {
+    (bucket, high_risk, wide_moat): (
+        "🔴 減碼" if high_risk else
+        "🟢 加碼" if bucket == 2 and wide_moat else
+        _BUCKET_RECOMMENDATIONS[bucket]
+    )
+    for bucket in _BUCKET_RECOMMENDATIONS
+    for high_risk in (False, True)
+    for wide_moat in (False, True)
+}
+
+
+def _safe_load_json(path: str):
+    """讀取 JSON 檔，檔案不存在時回傳 None"""
+    try:
+        return load_json(path)
+    except FileNotFoundError:
+        return None
+
 
 class PortfolioReportGenerator:
     """持倉分析報告生成器"""
@@ -16,41 +65,33 @@ class PortfolioReportGenerator:
         self.timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     
     def load_analysis_results(self) -> Dict:
-        """載入所有分析結果"""
-        results = {
-            'portfolio': {},
-            'tang_scores': {},
-            'moat_ratings': {},
-            'risk_levels': {}
-        }
+        """載入所有分析結果（各檔案並行讀取）"""
+        with ThreadPoolExecutor(max_workers=len(ANALYSIS_FILES)) as executor:
+            futures = {key: executor.submit(_safe_load_json, path) for key, path in ANALYSIS_FILES.items()}
         
-        # 載入持倉數據
-        try:
-            with open('data/config/portfolio_holdings.json', 'r', encoding='utf-8') as f:
-                results['portfolio'] = json.load(f)
-        except FileNotFoundError:
-            print("❌ 找不到持倉數據")
-            return results
-        
-        # 載入分析結果
-        analysis_files = {
-            'tang_scores': 'data/analysis/tang_scores.json',
-            'moat_ratings': 'data/analysis/moat_ratings.json',
-            'risk_levels': 'data/analysis/risk_levels.json'
-        }
-        
-        for key, filepath in analysis_files.items():
-            try:
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    results[key] = json.load(f)
-            except FileNotFoundError:
-                print(f"⚠️  找不到 {filepath}，跳過")
+        results = {}
+        for key, future in futures.items():
+            data = future.result()
+            if data is None:
+                if key == 'portfolio':
+                    print("❌ 找不到持倉數據")
+                else:
+                    print(f"⚠️  找不到 {ANALYSIS_FILES[key]}，跳過")
+            results[key] = data or {}
         
         return results
     
-    def generate_markdown_report(self, results: Dict) -> str:
-        """生成 Markdown 格式報告"""
-        report = f"""# 📊 持倉健康檢查報告
+    def generate_markdown_report(self, results: Dict, rows: Optional[List[Tuple[str, List, str]]] = None) -> str:
+        """生成 Markdown 格式報告（rows 為 iter_rows 的結果，未提供時自行計算）"""
+        return "".join(self.stream_markdown_report(results, rows))
+    
+    def stream_markdown_report(self, results: Dict,
+                               rows: Optional[List[Tuple[str, List, str]]] = None) -> Iterator[str]:
+        """逐段產生 Markdown 報告內容，可直接寫入檔案而不必先組成完整字串"""
+        if rows is None:
+            rows = list(self.iter_rows(results))
+        
+        yield f"""# 📊 持倉健康檢查報告
 
 **分析時間**: {self.timestamp}
 
@@ -59,65 +100,40 @@ class PortfolioReportGenerator:
 ## 一、持倉概況
 
 """
+        
+        table_rows = {market: [] for market in MARKETS}
+        for market, _, md_row in rows:
+            table_rows[market].append(md_row)
+        
         # 台股部分
-        taiwan_stocks = results['portfolio'].get('taiwan_stocks', {})
-        if taiwan_stocks:
-            report += "### 🇹🇼 台股持倉\n\n"
-            report += "| 股票代碼 | 名稱 | 成本價 | 持股數 | 唐石峻評分 | 護城河等級 | 風險等級 | 建議 |\n"
-            report += "|---------|------|--------|--------|-----------|----------|---------|------|\n"
-            
-            for ticker, info in taiwan_stocks.items():
-                name = info.get('name', '-')
-                cost = info.get('cost_price', '-')
-                shares = info.get('shares', '-')
-                
-                # 取得分析結果
-                tang_score = results['tang_scores'].get(ticker, {}).get('total_score', '-')
-                moat = results['moat_ratings'].get(ticker, {}).get('rating', '-')
-                risk = results['risk_levels'].get(ticker, {}).get('level', '-')
-                
-                # 決定建議
-                recommendation = self._get_recommendation(tang_score, moat, risk)
-                
-                report += f"| {ticker} | {name} | {cost} | {shares} | {tang_score} | {moat} | {risk} | {recommendation} |\n"
+        if table_rows['taiwan_stocks']:
+            yield "### 🇹🇼 台股持倉\n\n"
+            yield MARKDOWN_TABLE_HEADER
+            yield from table_rows['taiwan_stocks']
         
         # 美股部分
-        us_stocks = results['portfolio'].get('us_stocks', {})
-        if us_stocks:
-            report += "\n### 🇺🇸 美股持倉\n\n"
-            report += "| 股票代碼 | 名稱 | 成本價 | 持股數 | 唐石峻評分 | 護城河等級 | 風險等級 | 建議 |\n"
-            report += "|---------|------|--------|--------|-----------|----------|---------|------|\n"
-            
-            for ticker, info in us_stocks.items():
-                name = info.get('name', '-')
-                cost = info.get('cost_price', '-')
-                shares = info.get('shares', '-')
-                
-                tang_score = results['tang_scores'].get(ticker, {}).get('total_score', '-')
-                moat = results['moat_ratings'].get(ticker, {}).get('rating', '-')
-                risk = results['risk_levels'].get(ticker, {}).get('level', '-')
-                
-                recommendation = self._get_recommendation(tang_score, moat, risk)
-                
-                report += f"| {ticker} | {name} | ${cost} | {shares} | {tang_score} | {moat} | {risk} | {recommendation} |\n"
+        if table_rows['us_stocks']:
+            yield "\n### 🇺🇸 美股持倉\n\n"
+            yield MARKDOWN_TABLE_HEADER
+            yield from table_rows['us_stocks']
         
         # 風險提醒
-        report += "\n---\n\n## 二、重點關注事項\n\n"
+        yield "\n---\n\n## 二、重點關注事項\n\n"
         high_risk_stocks = [
             (ticker, data) for ticker, data in results['risk_levels'].items()
-            if data.get('level') in ['高風險', 'High Risk']
+            if data.get('level') in HIGH_RISK_LEVELS
         ]
         
         if high_risk_stocks:
-            report += "### ⚠️ 高風險標的\n\n"
+            yield "### ⚠️ 高風險標的\n\n"
             for ticker, data in high_risk_stocks:
                 reason = data.get('reason', '未知原因')
-                report += f"- **{ticker}**: {reason}\n"
+                yield f"- **{ticker}**: {reason}\n"
         else:
-            report += "✅ 目前無高風險標的\n"
+            yield "✅ 目前無高風險標的\n"
         
         # 底部說明
-        report += f"""
+        yield """
 
 ---
 
@@ -143,85 +159,76 @@ class PortfolioReportGenerator:
 *本報告由 Nebula AI 波克夏投資分析師自動生成*  
 *數據來源: 台灣證交所、Yahoo Finance*
 """
-        
-        return report
     
     def _get_recommendation(self, tang_score, moat, risk) -> str:
-        """根據三層分析給出建議"""
-        # 簡化邏輯
-        if risk in ['高風險', 'High Risk']:
-            return "🔴 減碼"
-        
+        """根據三層分析給出建議（查表）"""
         if isinstance(tang_score, (int, float)):
-            if tang_score >= 80:
-                if moat in ['寬護城河', 'Wide Moat']:
-                    return "🟢 加碼"
-                else:
-                    return "🟡 持有"
-            elif tang_score >= 60:
-                return "🟡 持有"
-            else:
-                return "🟠 觀察"
+            # NaN 與任何分界比較皆不成立，依原判斷邏輯歸入 <60 區間（bisect 會誤判為最高區間）
+            bucket = 0 if math.isnan(tang_score) else bisect.bisect(SCORE_BREAKPOINTS, tang_score)
+        else:
+            bucket = None
         
-        return "⚪ 待評估"
+        return RECOMMENDATION_TABLE[(bucket, risk in HIGH_RISK_LEVELS, moat in WIDE_MOAT_RATINGS)]
     
-    def save_report(self, report: str, filename: str = 'portfolio_health_report.md'):
-        """儲存報告"""
+    def save_report(self, results: Dict, rows: Optional[List[Tuple[str, List, str]]] = None,
+                    filename: str = 'portfolio_health_report.md'):
+        """儲存報告（逐段寫入，不在記憶體中組出完整報告）"""
         output_path = f'docs/{filename}'
         os.makedirs('docs', exist_ok=True)
         
         with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(report)
+            f.writelines(self.stream_markdown_report(results, rows))
         
         print(f"✅ 報告已儲存至 {output_path}")
         return output_path
     
-    def prepare_sheets_data(self, results: Dict) -> List[List]:
-        """準備要推送到 Google Sheets 的數據"""
-        rows = [['更新時間', self.timestamp, '', '', '', '', '', '']]
-        rows.append(['股票代碼', '名稱', '成本價', '持股數', '唐石峻評分', '護城河', '風險等級', '建議'])
+    def prepare_sheets_data(self, results: Dict, rows: Optional[List[Tuple[str, List, str]]] = None) -> List[List]:
+        """準備要推送到 Google Sheets 的數據（rows 為 iter_rows 的結果，未提供時自行計算）"""
+        if rows is None:
+            rows = list(self.iter_rows(results))
         
-        # 台股
-        for ticker, info in results['portfolio'].get('taiwan_stocks', {}).items():
-            tang_score = results['tang_scores'].get(ticker, {}).get('total_score', '-')
-            moat = results['moat_ratings'].get(ticker, {}).get('rating', '-')
-            risk = results['risk_levels'].get(ticker, {}).get('level', '-')
-            recommendation = self._get_recommendation(tang_score, moat, risk)
-            
-            rows.append([
-                ticker,
-                info.get('name', '-'),
-                info.get('cost_price', '-'),
-                info.get('shares', '-'),
-                tang_score,
-                moat,
-                risk,
-                recommendation
-            ])
+        sheets_rows = [
+            ['更新時間', self.timestamp, '', '', '', '', '', ''],
+            ['股票代碼', '名稱', '成本價', '持股數', '唐石峻評分', '護城河', '風險等級', '建議']
+        ]
+        sheets_rows.extend(row for _, row, _ in rows)
+        return sheets_rows
+    
+    def iter_rows(self, results: Dict) -> Iterator[Tuple[str, List, str]]:
+        """
+        依序走訪台股與美股持倉，每檔只組一次資料
         
-        # 美股
-        for ticker, info in results['portfolio'].get('us_stocks', {}).items():
-            tang_score = results['tang_scores'].get(ticker, {}).get('total_score', '-')
-            moat = results['moat_ratings'].get(ticker, {}).get('rating', '-')
-            risk = results['risk_levels'].get(ticker, {}).get('level', '-')
-            recommendation = self._get_recommendation(tang_score, moat, risk)
-            
-            rows.append([
-                ticker,
-                info.get('name', '-'),
-                f"${info.get('cost_price', '-')}",
-                info.get('shares', '-'),
-                tang_score,
-                moat,
-                risk,
-                recommendation
-            ])
+        Yields:
+            (市場鍵, Sheets 列, Markdown 表格列)
+        """
+        tang_scores = results['tang_scores']
+        moat_ratings = results['moat_ratings']
+        risk_levels = results['risk_levels']
         
-        return rows
+        for market in MARKETS:
+            for ticker, info in results['portfolio'].get(market, {}).items():
+                name = info.get('name', '-')
+                cost = info.get('cost_price', '-')
+                if market == 'us_stocks':
+                    cost = f"${cost}"
+                shares = info.get('shares', '-')
+                
+                # 取得分析結果
+                tang_score = tang_scores.get(ticker, {}).get('total_score', '-')
+                moat = moat_ratings.get(ticker, {}).get('rating', '-')
+                risk = risk_levels.get(ticker, {}).get('level', '-')
+                recommendation = self._get_recommendation(tang_score, moat, risk)
+                
+                row = [ticker, name, cost, shares, tang_score, moat, risk, recommendation]
+                yield market, row, _format_markdown_row(*row)
 
 
 def main():
     """主函數"""
+    parser = argparse.ArgumentParser(description='生成持倉健康檢查報告與 Google Sheets 數據')
+    parser.add_argument('--pretty', action='store_true', help='輸出縮排的 JSON，方便人工檢視')
+    args = parser.parse_args()
+    
     print("=" * 80)
     print("📊 生成持倉健康檢查報告")
     print("=" * 80)
@@ -232,19 +239,20 @@ def main():
     print("\n📂 載入分析結果...")
     results = generator.load_analysis_results()
     
+    # 持股列只組一次，報告與 Sheets 共用
+    rows = list(generator.iter_rows(results))
+    
     # 2. 生成 Markdown 報告
     print("📝 生成 Markdown 報告...")
-    report = generator.generate_markdown_report(results)
-    report_path = generator.save_report(report)
+    report_path = generator.save_report(results, rows)
     
     # 3. 準備 Google Sheets 數據
     print("📊 準備 Google Sheets 數據...")
-    sheets_data = generator.prepare_sheets_data(results)
+    sheets_data = generator.prepare_sheets_data(results, rows)
     
     # 建立 tmp 目錄並儲存 JSON 供後續使用
     os.makedirs('tmp', exist_ok=True)
-    with open('tmp/sheets_update_data.json', 'w', encoding='utf-8') as f:
-        json.dump({'rows': sheets_data}, f, ensure_ascii=False, indent=2)
+    dump_json({'rows': sheets_data}, 'tmp/sheets_update_data.json', pretty=args.pretty)
     
     print("\n✅ 報告生成完成")
     print(f"   - Markdown 報告: {report_path}")
@@ -0,0 +1,40 @@
+# cython: language_level=3, boundscheck=False, wraparound=False, cdivision=True
+"""
+唐石峻16指標的數值核心（Cython 版本）
+
+未安裝 numba 時由 tang_16_metrics 使用，需先編譯：
+    cythonize -i scripts/general/_metrics_ext.pyx
+"""
+
+from libc.math cimport NAN, isfinite, pow
+
+
+cpdef double score_linear(double value, double min_val, double max_val, double max_score=5.0):
+    """線性評分函數，數值無法計算（NaN/inf）時得 0 分"""
+    if not isfinite(value):
+        return 0.0
+    if value >= max_val:
+        return max_score
+    elif value <= min_val:
+        return 0.0
+    return max_score * (value - min_val) / (max_val - min_val)
+
+
+cpdef double cagr(const double[::1] values):
+    """計算複合年增長率（values 為由新到舊的數值陣列，忽略 0 與 NaN/inf）；期末為負時無實數解，回傳 NaN"""
+    cdef Py_ssize_t i, n = 0
+    cdef double first = 0.0, last = 0.0, x
+
+    for i in range(values.shape[0]):
+        x = values[i]
+        if isfinite(x) and x != 0.0:
+            if n == 0:
+                first = x
+            last = x
+            n += 1
+
+    if n < 2 or last <= 0:
+        return 0.0
+    if first < 0:
+        return NAN
+    return (pow(first / last, 1.0 / (n - 1)) - 1.0) * 100.0
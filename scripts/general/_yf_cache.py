@@ -0,0 +1,107 @@
+"""
+yfinance 財報的本地檔案快取（唐石峻評分與 Henry 供應鏈風險共用）
+
+每張財報存成 .cache/yf/<ticker>/<statement>.parquet，旁邊的 .json 記錄下載時間；
+未安裝 pyarrow 時改存 pickle
+"""
+
+import json
+import os
+import time
+from typing import Optional
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401  pandas 讀寫 parquet 需要
+    CACHE_EXT = 'parquet'
+except ImportError:  # 未安裝 pyarrow 時以 pickle 保存
+    CACHE_EXT = 'pkl'
+
+try:
+    import yfinance as yf
+except ImportError:  # 延後到實際下載財報時才報錯
+    yf = None
+
+# 可用環境變數 FINANCIALS_TTL（天）調整快取有效期
+DEFAULT_TTL_DAYS = float(os.environ.get('FINANCIALS_TTL', 30))
+STATEMENTS = ('financials', 'balance_sheet', 'cashflow')
+
+
+class FileCache:
+    """以 (ticker, 財報名稱) 為鍵的 DataFrame 檔案快取"""
+    
+    def __init__(self, cache_dir: str = os.path.join('.cache', 'yf')):
+        self.cache_dir = cache_dir
+    
+    def _paths(self, ticker: str, name: str):
+        base = os.path.join(self.cache_dir, ticker, name)
+        return f"{base}.{CACHE_EXT}", f"{base}.json"
+    
+    def get(self, ticker: str, name: str, ttl_days: float) -> Optional[pd.DataFrame]:
+        """讀取未過期的財報，沒有或已過期回傳 None"""
+        data_path, meta_path = self._paths(ticker, name)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                fetched_at = json.load(f)['fetched_at']
+            if time.time() - fetched_at > ttl_days * 86400:
+                return None
+            if CACHE_EXT == 'parquet':
+                # 寫入時已轉置成以日期為索引，讀回後轉回 yfinance 的原始方向
+                return pd.read_parquet(data_path).T
+            return pd.read_pickle(data_path)
+        except (OSError, ValueError, KeyError):
+            return None
+    
+    def set(self, ticker: str, name: str, df: pd.DataFrame):
+        """寫入財報並記錄下載時間"""
+        data_path, meta_path = self._paths(ticker, name)
+        os.makedirs(os.path.dirname(data_path), exist_ok=True)
+        if CACHE_EXT == 'parquet':
+            # parquet 欄位名稱須為字串，因此以科目為欄、日期為索引保存
+            df.T.to_parquet(data_path)
+        else:
+            df.to_pickle(data_path)
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump({'fetched_at': time.time()}, f)
+
+
+_CACHE = FileCache()
+
+
+def cached_statement(ticker: str, name: str, ttl_days: Optional[float] = None) -> Optional[pd.DataFrame]:
+    """只讀取本地快取，沒有或已過期回傳 None（不會連網）"""
+    if name not in STATEMENTS:
+        raise ValueError(f"不支援的財報名稱: {name}")
+    if ttl_days is None:
+        ttl_days = DEFAULT_TTL_DAYS
+    return _CACHE.get(ticker, name, ttl_days)
+
+
+def get_statement(ticker: str, name: str, ttl_days: Optional[float] = None, stock=None) -> pd.DataFrame:
+    """
+    取得 yfinance 財報（financials / balance_sheet / cashflow），優先讀取本地快取
+    
+    Args:
+        ticker: 股票代碼
+        name: 財報名稱，即 yf.Ticker 的屬性名
+        ttl_days: 快取有效天數，預設為 FINANCIALS_TTL
+        stock: 已建立的 yf.Ticker，未提供時自行建立
+    
+    Returns:
+        與 yf.Ticker 屬性相同格式的 DataFrame（科目為列、日期為欄）
+    """
+    cached = cached_statement(ticker, name, ttl_days)
+    if cached is not None:
+        return cached
+    
+    if stock is None:
+        if yf is None:
+            raise ImportError("需要 yfinance 才能下載財報，請先執行 pip install yfinance")
+        stock = yf.Ticker(ticker)
+    
+    df = getattr(stock, name)
+    # 空的財報不寫入快取，下次重新下載
+    if not df.empty:
+        _CACHE.set(ticker, name, df)
+    return df
@@ -1,3 +1,50 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from _yf_cache import STATEMENTS, get_statement
+
+try:
+    from numba import njit
+except ImportError:  # 未安裝 numba 時以純 Python 執行
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+try:
+    import yfinance as yf
+except ImportError:  # 延後到實際下載財報時才報錯
+    yf = None
+
+
+def _load_statements(ticker, years):
+    """
+    取得最近 N 年的損益表、資產負債表、現金流量表（已轉置）
+    
+    經由 _yf_cache.get_statement 讀取，與唐石峻評分共用 .cache/yf 下的財報快取與有效期
+    """
+    if yf is None:
+        raise ImportError("需要 yfinance 才能下載財報，請先執行 pip install yfinance")
+    
+    stock = yf.Ticker(ticker)
+    return tuple(get_statement(ticker, name, stock=stock).T.head(years) for name in STATEMENTS)
+
+
+@njit(cache=True)
+def calculate_volatility(values):
+    """計算波動率（標準差/平均值 × 100），忽略 0 與 NaN/inf；values 為 float64 一維陣列"""
+    arr = values[np.isfinite(values) & (values != 0.0)]
+    if arr.size < 2:
+        return 0.0
+    mean = arr.mean()
+    if mean == 0.0:
+        return 0.0
+    return arr.std() / mean * 100.0
+
+
 def transform(data, context):
     """
     Henry供應鏈風險評估器
@@ -19,57 +66,121 @@ def transform(data, context):
     
     輸出: 供應鏈風險評分 + 資本保全建議
     """
-    import yfinance as yf
-    import pandas as pd
-    import numpy as np
-    from datetime import datetime
-    
-    ticker = data.get('ticker')
-    years = data.get('years', 3)
-    major_customers = data.get('major_customers', [])
-    major_suppliers = data.get('major_suppliers', [])
-    industry_cycle = data.get('industry_cycle', 'unknown')
-    
-    if not ticker:
-        return {"error": "缺少必要參數: ticker"}
-    
-    # 下載財報數據
-    stock = yf.Ticker(ticker)
-    
-    try:
-        income_stmt = stock.financials.T
-        balance_sheet = stock.balance_sheet.T
-        cash_flow = stock.cashflow.T
-        
-        if income_stmt.empty or balance_sheet.empty or cash_flow.empty:
-            return {"error": f"無法獲取 {ticker} 的完整財報數據"}
-        
-        income_stmt = income_stmt.head(years)
-        balance_sheet = balance_sheet.head(years)
-        cash_flow = cash_flow.head(years)
-        
-    except Exception as e:
-        return {"error": f"數據獲取失敗: {str(e)}"}
+    return transform_batch([data], context)[0]
+
+
+def transform_batch(items, context):
+    """
+    批次評估多檔股票的供應鏈風險
     
+    財報以執行緒池並行下載，毛利率與營收波動改以 (檔數, 年數) 矩陣一次計算
     
-    def safe_get(df, key, default=0):
-        """安全獲取財報數據"""
-        try:
-            val = df.get(key, pd.Series([default] * len(df)))
-            return val.fillna(0)
-        except:
-            return pd.Series([default] * len(df))
-    
-    def calculate_volatility(series):
-        """計算波動率（標準差/平均值）"""
+    輸入: transform 的 data 字典列表
+    輸出: 與 items 順序一致的結果列表
+    """
+    def safe_get(df, key, default=np.nan):
+        """安全獲取財報數據；缺少該科目（如銀行無毛利）時回傳 NaN，視為數據不足而非 0"""
+        series = df.get(key)
+        if series is None:
+            return pd.Series(default, index=df.index, dtype='float64')
+        return series.fillna(0)
+    
+    def load(data):
         try:
-            values = [v for v in series if v != 0 and not pd.isna(v)]
-            if len(values) < 2:
-                return 0
-            return (np.std(values) / np.mean(values) * 100) if np.mean(values) != 0 else 0
-        except:
-            return 0
+            return _load_statements(data['ticker'], data.get('years', 3))
+        except Exception as e:
+            return e
+    
+    results = [None] * len(items)
+    pending = []
+    for i, data in enumerate(items):
+        if data.get('ticker'):
+            pending.append(i)
+        else:
+            results[i] = {"error": "缺少必要參數: ticker"}
+    
+    # 下載財報數據（含本地快取）
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        loaded = list(executor.map(load, [items[i] for i in pending]))
+    
+    valid = []
+    for i, statements in zip(pending, loaded):
+        ticker = items[i]['ticker']
+        if isinstance(statements, Exception):
+            results[i] = {"error": f"數據獲取失敗: {str(statements)}"}
+        elif any(df.empty for df in statements):
+            results[i] = {"error": f"無法獲取 {ticker} 的完整財報數據"}
+        else:
+            valid.append((i, statements[0]))
+    
+    if not valid:
+        return results
+    
+    # 各檔營收、毛利疊成 (檔數, 年數) 矩陣，年數不足者以 NaN 補齊
+    width = max(len(income_stmt) for _, income_stmt in valid)
+    revenue = np.full((len(valid), width), np.nan)
+    gross_profit = np.full((len(valid), width), np.nan)
+    lengths = np.empty(len(valid), dtype=np.intp)
+    for row, (_, income_stmt) in enumerate(valid):
+        n = len(income_stmt)
+        lengths[row] = n
+        revenue[row, :n] = safe_get(income_stmt, 'Total Revenue').to_numpy(np.float64)
+        gross_profit[row, :n] = safe_get(income_stmt, 'Gross Profit').to_numpy(np.float64)
+    
+    # 營收為 0 的年度毛利率記為 NaN（與唐石峻評分一致），不計入波動與趨勢
+    gross_margin = np.divide(gross_profit, revenue, out=np.full_like(revenue, np.nan), where=revenue != 0) * 100
+    margin_volatility = _volatility_rows(gross_margin)
+    revenue_volatility = _volatility_rows(revenue)
+    margin_trend = gross_margin[:, 0] - gross_margin[np.arange(len(valid)), lengths - 1]
+    
+    # 毛利率波動 < 5% 且趨勢向上 = 低風險
+    margin_conditions = [(margin_volatility < 5) & (margin_trend >= 0), margin_volatility < 10]
+    margin_scores = np.select(margin_conditions, [25, 15], default=5)
+    margin_levels = np.select(margin_conditions, ["低風險 - 毛利穩定", "中風險"], default="高風險 - 議價力弱化")
+    
+    revenue_conditions = [revenue_volatility < 10, revenue_volatility < 20]
+    revenue_scores = np.select(revenue_conditions, [15, 10], default=3)
+    revenue_levels = np.select(revenue_conditions, ["低風險", "中風險"], default="高風險 - 營收不穩定")
+    
+    analysis_date = datetime.now().strftime("%Y-%m-%d")
+    for row, (i, _) in enumerate(valid):
+        n = lengths[row]
+        margin_assessment = (int(margin_scores[row]), {
+            "recent_margin_pct": float(gross_margin[row, 0]),
+            "margin_history": gross_margin[row, :n].tolist(),
+            "volatility_pct": float(margin_volatility[row]),
+            "trend": "上升" if margin_trend[row] > 0 else "下降",
+            "risk_level": str(margin_levels[row])
+        })
+        revenue_assessment = (int(revenue_scores[row]), {
+            "revenue_history": revenue[row, :n].tolist(),
+            "volatility_pct": float(revenue_volatility[row]),
+            "risk_level": str(revenue_levels[row])
+        })
+        results[i] = _assess(items[i], margin_assessment, revenue_assessment, analysis_date)
+    
+    return results
+
+
+@njit(cache=True)
+def _volatility_rows(matrix):
+    """逐列計算波動率，NaN 補位會被 calculate_volatility 忽略"""
+    out = np.zeros(matrix.shape[0])
+    for i in range(matrix.shape[0]):
+        out[i] = calculate_volatility(matrix[i])
+    return out
+
+
+def _assess(data, margin_assessment, revenue_assessment, analysis_date):
+    """
+    組合單檔股票的風險評分與 Henry 檢查清單
     
+    margin_assessment / revenue_assessment 為 (分數, 明細)，由 transform_batch 批次算出
+    """
+    ticker = data['ticker']
+    major_customers = data.get('major_customers', [])
+    major_suppliers = data.get('major_suppliers', [])
+    industry_cycle = data.get('industry_cycle', 'unknown')
     
     risk_scores = {}
     risk_details = {}
@@ -140,67 +251,10 @@ def transform(data, context):
     
     
     # ========== 3. 毛利率穩定性 (25%) ==========
-    try:
-        revenue = safe_get(income_stmt, 'Total Revenue')
-        gross_profit = safe_get(income_stmt, 'Gross Profit')
-        gross_margin_series = (gross_profit / revenue * 100)
-        
-        gross_margin_volatility = calculate_volatility(gross_margin_series)
-        recent_margin = gross_margin_series.iloc[0]
-        margin_trend = gross_margin_series.iloc[0] - gross_margin_series.iloc[-1]
-        
-        # 毛利率波動 < 5% 且趨勢向上 = 低風險
-        if gross_margin_volatility < 5 and margin_trend >= 0:
-            margin_risk_score = 25
-            margin_risk_level = "低風險 - 毛利穩定"
-        elif gross_margin_volatility < 10:
-            margin_risk_score = 15
-            margin_risk_level = "中風險"
-        else:
-            margin_risk_score = 5
-            margin_risk_level = "高風險 - 議價力弱化"
-        
-        risk_details['gross_margin_stability'] = {
-            "recent_margin_pct": float(recent_margin),
-            "margin_history": gross_margin_series.tolist(),
-            "volatility_pct": float(gross_margin_volatility),
-            "trend": "上升" if margin_trend > 0 else "下降",
-            "risk_level": margin_risk_level
-        }
-        
-        risk_scores['gross_margin_stability'] = margin_risk_score
-        
-    except:
-        risk_scores['gross_margin_stability'] = 10
-        risk_details['gross_margin_stability'] = {"error": "數據不足"}
-    
-    
     # ========== 4. 營收波動性 (15%) ==========
-    try:
-        revenue_series = safe_get(income_stmt, 'Total Revenue')
-        revenue_volatility = calculate_volatility(revenue_series)
-        
-        if revenue_volatility < 10:
-            revenue_risk_score = 15
-            revenue_risk_level = "低風險"
-        elif revenue_volatility < 20:
-            revenue_risk_score = 10
-            revenue_risk_level = "中風險"
-        else:
-            revenue_risk_score = 3
-            revenue_risk_level = "高風險 - 營收不穩定"
-        
-        risk_details['revenue_stability'] = {
-            "revenue_history": revenue_series.tolist(),
-            "volatility_pct": float(revenue_volatility),
-            "risk_level": revenue_risk_level
-        }
-        
-        risk_scores['revenue_stability'] = revenue_risk_score
-        
-    except:
-        risk_scores['revenue_stability'] = 8
-        risk_details['revenue_stability'] = {"error": "數據不足"}
+    # 兩項皆由 transform_batch 針對整批股票一次計算
+    risk_scores['gross_margin_stability'], risk_details['gross_margin_stability'] = margin_assessment
+    risk_scores['revenue_stability'], risk_details['revenue_stability'] = revenue_assessment
     
     
     # ========== 5. 產業循環位置 (10%) ==========
@@ -269,7 +323,7 @@ def transform(data, context):
     
     return {
         "ticker": ticker,
-        "analysis_date": datetime.now().strftime("%Y-%m-%d"),
+        "analysis_date": analysis_date,
         "total_risk_score": round(total_risk_score, 2),
         "max_score": max_score,
         "risk_rating": risk_rating,
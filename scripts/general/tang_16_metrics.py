@@ -1,3 +1,55 @@
+import copy
+import math
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+from _yf_cache import STATEMENTS, cached_statement, get_statement
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:  # 未安裝 numba 時以純 Python 執行（有編譯好的 _metrics_ext 時改用 Cython 版本）
+    NUMBA_AVAILABLE = False
+    
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+try:
+    import yfinance as yf
+except ImportError:  # 延後到實際下載財報時才報錯
+    yf = None
+
+# 16 項指標在分數陣列中的順序：前 4 項為主觀判斷，其後 12 項由 _score_objective 計算
+SUBJECTIVE_KEYS = ('moat', 'geopolitical_risk', 'predictability', 'pricing_power')
+OBJECTIVE_KEYS = (
+    'financial_strength', 'share_dilution', 'capex', 'rnd', 'sbc', 'roic',
+    'fcf_growth', 'cash_quality', 'revenue_growth', 'op_income_growth', 'op_margin', 'margin_expansion'
+)
+IDX = {key: i for i, key in enumerate(SUBJECTIVE_KEYS + OBJECTIVE_KEYS)}
+N_SUBJECTIVE = len(SUBJECTIVE_KEYS)
+
+# 輸出報告中各指標的標籤，順序同 IDX
+SCORE_LABELS = (
+    '1_護城河', '2_地緣風險', '3_可預測性', '4_定價能力',
+    '5_財務狀況', '6_股權稀釋', '7_資本支出', '8_研發支出', '9_股票薪酬', '10_ROIC',
+    '11_FCF增長', '12_現金流品質', '13_營收增長', '14_經營利潤增長', '15_經營利潤率', '16_利潤率擴張'
+)
+
+# 不開 nnan/ninf：無法計算的指標以 NaN 表示，需保留 NaN 判斷
+_FASTMATH = {'nsz', 'arcp', 'contract', 'afn', 'reassoc'}
+
+# 同時向 Yahoo 發出的財報請求上限（整批股票、三張財報共用）
+MAX_DOWNLOADS = 8
+
+# 同一行程內重複評分的結果快取：(股票代碼, 年數, 主觀判斷) -> 結果
+RESULT_CACHE_SIZE = 256
+_RESULT_CACHE = {}
+
+
 def transform(data, context):
     """
     唐石峻16指標自動計算器
@@ -16,11 +68,6 @@ def transform(data, context):
     
     輸出: 16項指標評分 + 總分 + 詳細財報數據
     """
-    import yfinance as yf
-    import pandas as pd
-    import numpy as np
-    from datetime import datetime
-    
     ticker = data.get('ticker')
     years = data.get('years', 3)
     subjective = data.get('subjective', {})
@@ -28,295 +75,209 @@ def transform(data, context):
     if not ticker:
         return {"error": "缺少必要參數: ticker"}
     
-    # 下載財報數據
-    stock = yf.Ticker(ticker)
-    
-    try:
-        # 獲取財務數據
-        income_stmt = stock.financials.T  # 損益表
-        balance_sheet = stock.balance_sheet.T  # 資產負債表
-        cash_flow = stock.cashflow.T  # 現金流量表
-        
-        # 確保數據足夠（至少要有數據）
-        if income_stmt.empty or balance_sheet.empty or cash_flow.empty:
-            return {"error": f"無法獲取 {ticker} 的完整財報數據"}
-        
-        # 取最近N年數據
-        income_stmt = income_stmt.head(years)
-        balance_sheet = balance_sheet.head(years)
-        cash_flow = cash_flow.head(years)
-        
-    except Exception as e:
-        return {"error": f"數據獲取失敗: {str(e)}"}
-    
-    
-    # ============ 主觀判斷（40%）============
-    scores = {}
-    
-    # 1. 護城河 (15%)
-    scores['moat'] = subjective.get('moat', 0)
-    
-    # 2. 地緣風險 (5%)
-    scores['geopolitical_risk'] = subjective.get('geopolitical_risk', 0)
-    
-    # 3. 可預測性 (10%)
-    scores['predictability'] = subjective.get('predictability', 0)
-    
-    # 4. 定價能力 (10%)
-    scores['pricing_power'] = subjective.get('pricing_power', 0)
-    
-    
-    # ============ 客觀表現（60%）============
-    
-    def safe_get(df, key, default=0):
-        """安全獲取財報數據"""
-        try:
-            val = df.get(key, pd.Series([default] * len(df)))
-            return val.fillna(0)
-        except:
-            return pd.Series([default] * len(df))
-    
-    def calculate_cagr(values):
-        """計算複合年增長率"""
-        try:
-            values = [v for v in values if v != 0 and not pd.isna(v)]
-            if len(values) < 2:
-                return 0
-            start = values[-1]
-            end = values[0]
-            n = len(values) - 1
-            if start <= 0:
-                return 0
-            cagr = (pow(end / start, 1/n) - 1) * 100
-            return cagr
-        except:
-            return 0
-    
-    def score_linear(value, min_val, max_val, max_score=5):
-        """線性評分函數"""
-        if value >= max_val:
-            return max_score
-        elif value <= min_val:
-            return 0
-        else:
-            return max_score * (value - min_val) / (max_val - min_val)
-    
-    
-    # 5. 財務狀況 (5%) - (現金 + 1年FCF) / 總借款
-    try:
-        cash = safe_get(balance_sheet, 'Cash And Cash Equivalents').iloc[0]
-        total_debt = safe_get(balance_sheet, 'Total Debt').iloc[0]
-        fcf = safe_get(cash_flow, 'Free Cash Flow').iloc[0]
-        
-        if total_debt > 0:
-            financial_strength_ratio = (cash + fcf) / total_debt
-        else:
-            financial_strength_ratio = 999  # 無負債視為極佳
-        
-        scores['financial_strength'] = score_linear(financial_strength_ratio, 0.3, 1.0, 5)
-        raw_data_financial = {
-            "cash": float(cash),
-            "fcf": float(fcf),
-            "total_debt": float(total_debt),
-            "ratio": float(financial_strength_ratio)
-        }
-    except:
-        scores['financial_strength'] = 0
-        raw_data_financial = {"error": "數據不足"}
-    
-    
-    # 6. 股權稀釋 (5%) - 流通股數CAGR
-    try:
-        shares = safe_get(income_stmt, 'Diluted Average Shares')
-        share_cagr = calculate_cagr(shares.tolist())
-        
-        # CAGR < -3% 得滿分（回購），> 0% 得零分（增發）
-        scores['share_dilution'] = score_linear(-share_cagr, 0, 3, 5)
-        raw_data_shares = {
-            "share_count_history": shares.tolist(),
-            "cagr": float(share_cagr)
-        }
-    except:
-        scores['share_dilution'] = 0
-        raw_data_shares = {"error": "數據不足"}
-    
-    
-    # 7. 資本支出 (5%) - Capex / OCF
-    try:
-        capex = safe_get(cash_flow, 'Capital Expenditure').abs()
-        ocf = safe_get(cash_flow, 'Operating Cash Flow')
-        capex_ratio = (capex.iloc[0] / ocf.iloc[0] * 100) if ocf.iloc[0] > 0 else 0
-        
-        # < 10% 得滿分（輕資產），> 60% 得零分
-        scores['capex'] = score_linear(60 - capex_ratio, 0, 50, 5)
-        raw_data_capex = {
-            "capex": float(capex.iloc[0]),
-            "ocf": float(ocf.iloc[0]),
-            "ratio_pct": float(capex_ratio)
-        }
-    except:
-        scores['capex'] = 0
-        raw_data_capex = {"error": "數據不足"}
-    
-    
-    # 8. 研發支出 (5%) - R&D / OCF
-    try:
-        rnd = safe_get(income_stmt, 'Research And Development')
-        ocf_rnd = safe_get(cash_flow, 'Operating Cash Flow')
-        rnd_ratio = (rnd.iloc[0] / ocf_rnd.iloc[0] * 100) if ocf_rnd.iloc[0] > 0 else 0
-        
-        # < 10% 得滿分，> 50% 得零分
-        scores['rnd'] = score_linear(50 - rnd_ratio, 0, 40, 5)
-        raw_data_rnd = {
-            "rnd": float(rnd.iloc[0]),
-            "ocf": float(ocf_rnd.iloc[0]),
-            "ratio_pct": float(rnd_ratio)
-        }
-    except:
-        scores['rnd'] = 0
-        raw_data_rnd = {"error": "數據不足"}
-    
-    
-    # 9. 股票薪酬 (5%) - SBC / OCF
-    try:
-        sbc = safe_get(cash_flow, 'Stock Based Compensation')
-        ocf_sbc = safe_get(cash_flow, 'Operating Cash Flow')
-        sbc_ratio = (sbc.iloc[0] / ocf_sbc.iloc[0] * 100) if ocf_sbc.iloc[0] > 0 else 0
-        
-        # < 5% 得滿分，> 25% 得零分
-        scores['sbc'] = score_linear(25 - sbc_ratio, 0, 20, 5)
-        raw_data_sbc = {
-            "sbc": float(sbc.iloc[0]),
-            "ocf": float(ocf_sbc.iloc[0]),
-            "ratio_pct": float(sbc_ratio)
-        }
-    except:
-        scores['sbc'] = 0
-        raw_data_sbc = {"error": "數據不足"}
-    
-    
-    # 10. 投資資本回報率 ROIC (5%)
-    try:
-        nopat = safe_get(income_stmt, 'Operating Income').iloc[0] * 0.79  # 假設稅率21%
-        total_equity = safe_get(balance_sheet, 'Total Equity Gross Minority Interest').iloc[0]
-        total_debt_roic = safe_get(balance_sheet, 'Total Debt').iloc[0]
-        invested_capital = total_equity + total_debt_roic
-        
-        roic = (nopat / invested_capital * 100) if invested_capital > 0 else 0
-        
-        # > 50% 得滿分
-        scores['roic'] = score_linear(roic, 0, 50, 5)
-        raw_data_roic = {
-            "nopat": float(nopat),
-            "invested_capital": float(invested_capital),
-            "roic_pct": float(roic)
-        }
-    except:
-        scores['roic'] = 0
-        raw_data_roic = {"error": "數據不足"}
-    
+    return transform_many([ticker], years, {ticker: subjective})[ticker]
+
+
+def transform_many(tickers, years=3, subjective=None):
+    """
+    批次計算多檔股票的唐石峻16指標
     
-    # 11. 自由現金流增長 (5%)
-    try:
-        fcf_series = safe_get(cash_flow, 'Free Cash Flow')
-        fcf_cagr = calculate_cagr(fcf_series.tolist())
-        
-        # CAGR > 20% 得滿分，< 5% 得零分
-        scores['fcf_growth'] = score_linear(fcf_cagr, 5, 20, 5)
-        raw_data_fcf_growth = {
-            "fcf_history": fcf_series.tolist(),
-            "cagr": float(fcf_cagr)
-        }
-    except:
-        scores['fcf_growth'] = 0
-        raw_data_fcf_growth = {"error": "數據不足"}
+    財報先讀本地快取，未命中者以單一執行緒池並行下載（網路 I/O 為主要耗時），再逐檔評分；
+    同一行程內已評分過的組合直接回傳快取結果
     
+    Args:
+        tickers: 股票代碼列表
+        years: 分析年數
+        subjective: {股票代碼: 主觀判斷字典}，未提供的股票主觀分數為 0
     
-    # 12. 現金流品質 (5%) - OCF / Net Income
-    try:
-        ocf_quality = safe_get(cash_flow, 'Operating Cash Flow').iloc[0]
-        net_income = safe_get(income_stmt, 'Net Income').iloc[0]
+    Returns:
+        {股票代碼: transform 格式的結果}
+    """
+    subjective = subjective or {}
+    keys = {ticker: (ticker, years, frozenset(subjective.get(ticker, {}).items())) for ticker in tickers}
+    pending = [ticker for ticker in tickers if keys[ticker] not in _RESULT_CACHE]
+    loaded = _load_statements(pending) if pending else {}
+    
+    results = {}
+    for ticker in tickers:
+        key = keys[ticker]
+        if key in _RESULT_CACHE:
+            results[ticker] = copy.deepcopy(_RESULT_CACHE[key])
+            continue
         
-        quality_ratio = (ocf_quality / net_income) if net_income > 0 else 0
+        statements = loaded[ticker]
+        if isinstance(statements, Exception):
+            results[ticker] = {"error": f"數據獲取失敗: {str(statements)}"}
+            continue
         
-        # > 1 得滿分，< 0.2 得零分
-        scores['cash_quality'] = score_linear(quality_ratio, 0.2, 1.0, 5)
-        raw_data_quality = {
-            "ocf": float(ocf_quality),
-            "net_income": float(net_income),
-            "ratio": float(quality_ratio)
-        }
-    except:
-        scores['cash_quality'] = 0
-        raw_data_quality = {"error": "數據不足"}
-    
+        statements = _prepare_statements(statements, years)
+        if statements is None:
+            results[ticker] = {"error": f"無法獲取 {ticker} 的完整財報數據"}
+        else:
+            results[ticker] = _score_statements(ticker, *statements, subjective.get(ticker, {}))
+            _cache_result(key, results[ticker])
+    
+    return results
+
+
+def _cache_result(key, result):
+    """保存評分結果（下載失敗不保存，下次重試），超過上限時淘汰最早的項目"""
+    if len(_RESULT_CACHE) >= RESULT_CACHE_SIZE:
+        del _RESULT_CACHE[next(iter(_RESULT_CACHE))]
+    _RESULT_CACHE[key] = copy.deepcopy(result)
+
+
+def _load_statements(tickers):
+    """
+    取得多檔股票的損益表、資產負債表、現金流量表（yfinance 原始方向）
     
-    # 13. 營收增長 (5%)
-    try:
-        revenue = safe_get(income_stmt, 'Total Revenue')
-        revenue_cagr = calculate_cagr(revenue.tolist())
-        
-        # CAGR > 20% 得滿分，< 0% 得零分
-        scores['revenue_growth'] = score_linear(revenue_cagr, 0, 20, 5)
-        raw_data_revenue = {
-            "revenue_history": revenue.tolist(),
-            "cagr": float(revenue_cagr)
-        }
-    except:
-        scores['revenue_growth'] = 0
-        raw_data_revenue = {"error": "數據不足"}
+    先讀本地快取；未命中的 (股票, 財報) 才交給同一個執行緒池下載，同時請求數不超過 MAX_DOWNLOADS
     
+    Returns:
+        {股票代碼: (損益表, 資產負債表, 現金流量表)，下載失敗時為該例外}
+    """
+    frames = {}
+    misses = []
+    for ticker in tickers:
+        for name in STATEMENTS:
+            df = cached_statement(ticker, name)
+            if df is None:
+                misses.append((ticker, name))
+            else:
+                frames[ticker, name] = df
+    
+    errors = {}
+    if misses:
+        if yf is None:
+            error = ImportError("需要 yfinance 才能下載財報，請先執行 pip install yfinance")
+            errors = {ticker: error for ticker, _ in misses}
+        else:
+            stocks = {ticker: yf.Ticker(ticker) for ticker, _ in misses}
+            with ThreadPoolExecutor(max_workers=min(MAX_DOWNLOADS, len(misses))) as executor:
+                futures = {
+                    (ticker, name): executor.submit(get_statement, ticker, name, stock=stocks[ticker])
+                    for ticker, name in misses
+                }
+            for (ticker, name), future in futures.items():
+                try:
+                    frames[ticker, name] = future.result()
+                except Exception as e:
+                    errors.setdefault(ticker, e)
     
-    # 14. 經營利潤增長 (5%)
-    try:
-        op_income = safe_get(income_stmt, 'Operating Income')
-        op_income_cagr = calculate_cagr(op_income.tolist())
-        
-        # CAGR > 20% 得滿分，< 0% 得零分
-        scores['op_income_growth'] = score_linear(op_income_cagr, 0, 20, 5)
-        raw_data_op_growth = {
-            "op_income_history": op_income.tolist(),
-            "cagr": float(op_income_cagr)
-        }
-    except:
-        scores['op_income_growth'] = 0
-        raw_data_op_growth = {"error": "數據不足"}
+    return {
+        ticker: errors[ticker] if ticker in errors else tuple(frames[ticker, name] for name in STATEMENTS)
+        for ticker in tickers
+    }
+
+
+def _prepare_statements(statements, years):
+    """
+    將三張原始財報轉置為以日期為列並取最近 N 年
     
+    財報不完整時回傳 None
+    """
+    income_stmt, balance_sheet, cash_flow = (df.T for df in statements)
+    
+    # 確保數據足夠（至少要有數據）
+    if income_stmt.empty or balance_sheet.empty or cash_flow.empty:
+        return None
+    
+    # 取最近N年數據（評分時只取出用到的科目轉成 float64，不必轉換整張表的型別）
+    return tuple(df.head(years) for df in (income_stmt, balance_sheet, cash_flow))
+
+
+def _score_statements(ticker, income_stmt, balance_sheet, cash_flow, subjective):
+    """依已下載的三張財報計算 16 項指標評分"""
+    # ============ 主觀判斷（40%）============
+    # 護城河 (15%)、地緣風險 (5%)、可預測性 (10%)、定價能力 (10%)
+    scores = np.zeros(len(IDX), dtype=np.float64)
+    for key in SUBJECTIVE_KEYS:
+        scores[IDX[key]] = subjective.get(key, 0)
     
-    # 15. 經營利潤率 (5%)
-    try:
-        op_margin = (safe_get(income_stmt, 'Operating Income').iloc[0] / 
-                     safe_get(income_stmt, 'Total Revenue').iloc[0] * 100)
-        
-        # > 40% 得滿分
-        scores['op_margin'] = score_linear(op_margin, 0, 40, 5)
-        raw_data_margin = {"op_margin_pct": float(op_margin)}
-    except:
-        scores['op_margin'] = 0
-        raw_data_margin = {"error": "數據不足"}
     
+    # ============ 客觀表現（60%）============
     
-    # 16. 經營利潤率擴張 (5%)
-    try:
-        revenue_series = safe_get(income_stmt, 'Total Revenue')
-        op_income_series = safe_get(income_stmt, 'Operating Income')
-        margins = (op_income_series / revenue_series * 100).tolist()
-        
-        margin_cagr = calculate_cagr(margins)
-        
-        # CAGR > 2% 得滿分，< -4% 得零分
-        scores['margin_expansion'] = score_linear(margin_cagr, -4, 2, 5)
-        raw_data_expansion = {
-            "margin_history": margins,
-            "cagr": float(margin_cagr)
-        }
-    except:
-        scores['margin_expansion'] = 0
-        raw_data_expansion = {"error": "數據不足"}
+    # 一次取出所有用到的科目為 float64 陣列（缺值與缺少的科目補 0），之後只做陣列索引
+    F = {}
+    for df, keys in (
+        (income_stmt, ('Diluted Average Shares', 'Research And Development', 'Operating Income',
+                       'Net Income', 'Total Revenue')),
+        (balance_sheet, ('Cash And Cash Equivalents', 'Total Debt', 'Total Equity Gross Minority Interest')),
+        (cash_flow, ('Free Cash Flow', 'Capital Expenditure', 'Operating Cash Flow', 'Stock Based Compensation'))
+    ):
+        for key in keys:
+            F[key] = df[key].to_numpy(dtype=np.float64, na_value=0.0) if key in df else np.zeros(len(df))
+    
+    # 客觀指標由 kernel 直接寫入 scores[4:16]
+    v, margins = _score_objective(
+        scores[N_SUBJECTIVE:], F['Cash And Cash Equivalents'], F['Total Debt'], F['Free Cash Flow'],
+        F['Diluted Average Shares'], F['Capital Expenditure'], F['Operating Cash Flow'], F['Research And Development'],
+        F['Stock Based Compensation'], F['Operating Income'], F['Total Equity Gross Minority Interest'],
+        F['Net Income'], F['Total Revenue']
+    )
+    
+    # 整理各指標的原始數據（數值為 NaN/inf 代表無法計算）
+    ocf0 = float(F['Operating Cash Flow'][0])
+    raw_data_financial = {"error": "數據不足"} if not math.isfinite(v[0]) else {
+        "cash": float(F['Cash And Cash Equivalents'][0]),
+        "fcf": float(F['Free Cash Flow'][0]),
+        "total_debt": float(F['Total Debt'][0]),
+        "ratio": float(v[0])
+    }
+    raw_data_shares = {"error": "數據不足"} if not math.isfinite(v[1]) else {
+        "share_count_history": F['Diluted Average Shares'].tolist(),
+        "cagr": float(v[1])
+    }
+    raw_data_capex = {"error": "數據不足"} if not math.isfinite(v[2]) else {
+        "capex": float(abs(F['Capital Expenditure'][0])),
+        "ocf": ocf0,
+        "ratio_pct": float(v[2])
+    }
+    raw_data_rnd = {"error": "數據不足"} if not math.isfinite(v[3]) else {
+        "rnd": float(F['Research And Development'][0]),
+        "ocf": ocf0,
+        "ratio_pct": float(v[3])
+    }
+    raw_data_sbc = {"error": "數據不足"} if not math.isfinite(v[4]) else {
+        "sbc": float(F['Stock Based Compensation'][0]),
+        "ocf": ocf0,
+        "ratio_pct": float(v[4])
+    }
+    raw_data_roic = {"error": "數據不足"} if not math.isfinite(v[7]) else {
+        "nopat": float(v[5]),
+        "invested_capital": float(v[6]),
+        "roic_pct": float(v[7])
+    }
+    raw_data_fcf_growth = {"error": "數據不足"} if not math.isfinite(v[8]) else {
+        "fcf_history": F['Free Cash Flow'].tolist(),
+        "cagr": float(v[8])
+    }
+    raw_data_quality = {"error": "數據不足"} if not math.isfinite(v[9]) else {
+        "ocf": ocf0,
+        "net_income": float(F['Net Income'][0]),
+        "ratio": float(v[9])
+    }
+    raw_data_revenue = {"error": "數據不足"} if not math.isfinite(v[10]) else {
+        "revenue_history": F['Total Revenue'].tolist(),
+        "cagr": float(v[10])
+    }
+    raw_data_op_growth = {"error": "數據不足"} if not math.isfinite(v[11]) else {
+        "op_income_history": F['Operating Income'].tolist(),
+        "cagr": float(v[11])
+    }
+    raw_data_margin = {"error": "數據不足"} if not math.isfinite(v[12]) else {"op_margin_pct": float(v[12])}
+    raw_data_expansion = {"error": "數據不足"} if not math.isfinite(v[13]) else {
+        "margin_history": margins.tolist(),
+        "cagr": float(v[13])
+    }
     
     
     # ============ 計算總分 ============
-    total_score = sum(scores.values())
+    subjective_scores = scores[:N_SUBJECTIVE]
+    objective_scores = scores[N_SUBJECTIVE:]
+    subjective_total = float(subjective_scores.sum())
+    objective_total = float(objective_scores.sum())
+    total_score = subjective_total + objective_total
     
     # 評級
     if total_score >= 80:
@@ -336,28 +297,12 @@ def transform(data, context):
         "rating": rating,
         "scores": {
             "主觀判斷 (40%)": {
-                "1_護城河": scores['moat'],
-                "2_地緣風險": scores['geopolitical_risk'],
-                "3_可預測性": scores['predictability'],
-                "4_定價能力": scores['pricing_power'],
-                "小計": sum([scores['moat'], scores['geopolitical_risk'], 
-                           scores['predictability'], scores['pricing_power']])
+                **dict(zip(SCORE_LABELS[:N_SUBJECTIVE], subjective_scores.tolist())),
+                "小計": subjective_total
             },
             "客觀表現 (60%)": {
-                "5_財務狀況": round(scores['financial_strength'], 2),
-                "6_股權稀釋": round(scores['share_dilution'], 2),
-                "7_資本支出": round(scores['capex'], 2),
-                "8_研發支出": round(scores['rnd'], 2),
-                "9_股票薪酬": round(scores['sbc'], 2),
-                "10_ROIC": round(scores['roic'], 2),
-                "11_FCF增長": round(scores['fcf_growth'], 2),
-                "12_現金流品質": round(scores['cash_quality'], 2),
-                "13_營收增長": round(scores['revenue_growth'], 2),
-                "14_經營利潤增長": round(scores['op_income_growth'], 2),
-                "15_經營利潤率": round(scores['op_margin'], 2),
-                "16_利潤率擴張": round(scores['margin_expansion'], 2),
-                "小計": round(sum([scores[k] for k in scores if k not in 
-                                 ['moat', 'geopolitical_risk', 'predictability', 'pricing_power']]), 2)
+                **{label: round(score, 2) for label, score in zip(SCORE_LABELS[N_SUBJECTIVE:], objective_scores.tolist())},
+                "小計": round(objective_total, 2)
             }
         },
         "raw_financial_data": {
@@ -375,3 +320,130 @@ def transform(data, context):
             "margin_expansion": raw_data_expansion
         }
     }
+
+
+def _load_metrics_ext():
+    """載入 Cython 編譯的 _metrics_ext，尚未編譯時回傳 None"""
+    try:
+        import _metrics_ext
+    except ImportError:
+        return None
+    return _metrics_ext
+
+
+@njit(cache=True, fastmath=_FASTMATH)
+def _score_linear(value, min_val, max_val, max_score=5.0):
+    """線性評分函數，數值無法計算（NaN/inf）時得 0 分"""
+    if not math.isfinite(value):
+        return 0.0
+    if value >= max_val:
+        return max_score
+    elif value <= min_val:
+        return 0.0
+    else:
+        return max_score * (value - min_val) / (max_val - min_val)
+
+
+@njit(cache=True, fastmath=_FASTMATH)
+def _cagr(values):
+    """計算複合年增長率（values 為由新到舊的數值陣列，忽略 0 與 NaN/inf）；期末為負時無實數解，回傳 NaN"""
+    a = values[np.isfinite(values) & (values != 0.0)]
+    if a.size < 2 or a[-1] <= 0:
+        return 0.0
+    if a[0] < 0:
+        return np.nan
+    return ((a[0] / a[-1]) ** (1.0 / (a.size - 1)) - 1.0) * 100.0
+
+
+# 未安裝 numba 但已編譯 _metrics_ext 時，CAGR 與線性評分改用 Cython 版本
+# （此時 kernel 以純 Python 執行，呼叫時才查找這兩個名稱）
+if not NUMBA_AVAILABLE:
+    _metrics_ext = _load_metrics_ext()
+    if _metrics_ext is not None:
+        _score_linear = _metrics_ext.score_linear
+        _cagr = _metrics_ext.cagr
+
+
+@njit(cache=True, fastmath=_FASTMATH, error_model='numpy')
+def _score_objective(scores, cash, debt, fcf, shares, capex, ocf, rnd, sbc, op_inc, equity, ni, revenue):
+    """
+    計算 12 項客觀指標，依 OBJECTIVE_KEYS 順序寫入 scores（其餘參數為由新到舊的 float64 陣列）
+    
+    Returns:
+        (中間數值, 各年經營利潤率)
+        中間數值依序為：財務狀況比率、股數CAGR、資本支出比、研發比、股票薪酬比、NOPAT、投入資本、
+        ROIC、FCF CAGR、現金流品質比率、營收CAGR、經營利潤CAGR、經營利潤率、利潤率CAGR
+    """
+    values = np.zeros(14)
+    
+    # 多個指標共用的最新一年數值只取一次
+    ocf0 = ocf[0]
+    debt0 = debt[0]
+    # 營收為 0 的年份利潤率記為 NaN（無法計算），不產生 inf
+    margins = op_inc / np.where(revenue == 0.0, np.nan, revenue) * 100
+    
+    # 5. 財務狀況 (5%) - (現金 + 1年FCF) / 總借款，無負債視為極佳
+    ratio = (cash[0] + fcf[0]) / debt0 if debt0 > 0 else 999.0
+    scores[0] = _score_linear(ratio, 0.3, 1.0)
+    values[0] = ratio
+    
+    # 6. 股權稀釋 (5%) - 流通股數CAGR < -3% 得滿分（回購），> 0% 得零分（增發）
+    share_cagr = _cagr(shares)
+    scores[1] = _score_linear(-share_cagr, 0.0, 3.0)
+    values[1] = share_cagr
+    
+    # 7. 資本支出 (5%) - Capex / OCF < 10% 得滿分（輕資產），> 60% 得零分
+    capex_ratio = abs(capex[0]) / ocf0 * 100 if ocf0 > 0 else 0.0
+    scores[2] = _score_linear(60 - capex_ratio, 0.0, 50.0)
+    values[2] = capex_ratio
+    
+    # 8. 研發支出 (5%) - R&D / OCF < 10% 得滿分，> 50% 得零分
+    rnd_ratio = rnd[0] / ocf0 * 100 if ocf0 > 0 else 0.0
+    scores[3] = _score_linear(50 - rnd_ratio, 0.0, 40.0)
+    values[3] = rnd_ratio
+    
+    # 9. 股票薪酬 (5%) - SBC / OCF < 5% 得滿分，> 25% 得零分
+    sbc_ratio = sbc[0] / ocf0 * 100 if ocf0 > 0 else 0.0
+    scores[4] = _score_linear(25 - sbc_ratio, 0.0, 20.0)
+    values[4] = sbc_ratio
+    
+    # 10. 投資資本回報率 ROIC (5%) - > 50% 得滿分，假設稅率21%
+    nopat = op_inc[0] * 0.79
+    invested_capital = equity[0] + debt0
+    roic = nopat / invested_capital * 100 if invested_capital > 0 else 0.0
+    scores[5] = _score_linear(roic, 0.0, 50.0)
+    values[5] = nopat
+    values[6] = invested_capital
+    values[7] = roic
+    
+    # 11. 自由現金流增長 (5%) - CAGR > 20% 得滿分，< 5% 得零分
+    fcf_cagr = _cagr(fcf)
+    scores[6] = _score_linear(fcf_cagr, 5.0, 20.0)
+    values[8] = fcf_cagr
+    
+    # 12. 現金流品質 (5%) - OCF / Net Income > 1 得滿分，< 0.2 得零分
+    quality_ratio = ocf0 / ni[0] if ni[0] > 0 else 0.0
+    scores[7] = _score_linear(quality_ratio, 0.2, 1.0)
+    values[9] = quality_ratio
+    
+    # 13. 營收增長 (5%) - CAGR > 20% 得滿分，< 0% 得零分
+    revenue_cagr = _cagr(revenue)
+    scores[8] = _score_linear(revenue_cagr, 0.0, 20.0)
+    values[10] = revenue_cagr
+    
+    # 14. 經營利潤增長 (5%) - CAGR > 20% 得滿分，< 0% 得零分
+    op_income_cagr = _cagr(op_inc)
+    scores[9] = _score_linear(op_income_cagr, 0.0, 20.0)
+    values[11] = op_income_cagr
+    
+    # 15. 經營利潤率 (5%) - > 40% 得滿分，即最新一年的利潤率（營收為 0 時無法計算）
+    op_margin = margins[0]
+    scores[10] = _score_linear(op_margin, 0.0, 40.0)
+    values[12] = op_margin
+    
+    # 16. 經營利潤率擴張 (5%) - CAGR > 2% 得滿分，< -4% 得零分
+    margin_cagr = _cagr(margins)
+    scores[11] = _score_linear(margin_cagr, -4.0, 2.0)
+    values[13] = margin_cagr
+    
+    return values, margins